@@ -16,6 +16,9 @@ from pricing_logic import (
     vat_rules,
     city_pricing,
     feedback_memory,
+    uncertainty,
+    analytics,
+    shadow,
 )
 
 OUTPUT_PATH = "output/sample_quote.json"
@@ -171,7 +174,11 @@ def get_margin_for_city(city):
         return 0.15
 
 
-def generate_quote(tasks, city):
+def generate_quote(tasks, city, price_ranges=False, n_samples=uncertainty.DEFAULT_SAMPLES):
+    """
+    Builds the quote for parsed tasks. With price_ranges=True, a Monte Carlo
+    P10/P50/P90 price range is attached to each task and to the quote total.
+    """
     material_db_inst = material_db.MaterialDB()
     labor_calc_inst = labor_calc.LaborCalc()
     feedback_mem = feedback_memory.FeedbackMemory()
@@ -183,17 +190,22 @@ def generate_quote(tasks, city):
     city_material_multiplier = city_pricing.get_city_material_multiplier(city)
     margin = get_margin_for_city(city)
     quote_tasks = []
+    sampling_inputs = []
     for task in tasks:
         task_confidence = 1.0
         # --- Material cost ---
         material_costs = []
+        material_lines = []
         material_total = 0
         for mat in task.get("materials", []):
             mat_name = mat["name"]
             unit_price = material_db_inst.get_price(mat_name)
             unit = material_db_inst.get_unit(mat_name)
-            if unit and unit in ["m2", "liter"] and task.get("room_size_m2"):
-                quantity = task["room_size_m2"]
+            area_based = bool(unit in ["m2", "liter"] and task.get("room_size_m2"))
+            waste_factor = 1.0
+            if area_based:
+                waste_factor = material_db_inst.get_waste_factor(mat_name)
+                quantity = task["room_size_m2"] * waste_factor
             else:
                 quantity = 1
             if unit_price is None:
@@ -210,6 +222,14 @@ def generate_quote(tasks, city):
                     "total": round(mat_total, 2),
                 }
             )
+            material_lines.append(
+                {
+                    "name": mat_name,
+                    "cost": mat_total,
+                    "area_based": area_based,
+                    "waste_factor": waste_factor,
+                }
+            )
             material_total += mat_total
         # --- Labor cost ---
         hours, labor_cost = labor_calc_inst.estimate_labor(task["name"], city)
@@ -228,6 +248,17 @@ def generate_quote(tasks, city):
         vat_total += vat_amt
         margin_total += margin_amt
         confidences.append(task_confidence)
+        if price_ranges:
+            template_name, _ = labor_calc_inst.match_template(task["name"])
+            sampling_inputs.append(
+                {
+                    "template": template_name,
+                    "labor_cost": labor_cost,
+                    "materials": material_lines,
+                    "margin": margin,
+                    "vat_rate": vat_rate,
+                }
+            )
         quote_tasks.append(
             {
                 "name": task["name"],
@@ -256,9 +287,23 @@ def generate_quote(tasks, city):
         "confidence": round(avg_confidence, 2),
         "error_flag": error_flag,
     }
+    if price_ranges:
+        estimator = uncertainty.PriceRangeEstimator(n_samples=n_samples)
+        task_ranges, total_range = estimator.estimate(sampling_inputs)
+        for quote_task, task_range in zip(quote_tasks, task_ranges):
+            quote_task["price_range"] = uncertainty.format_range(task_range)
+        quote["price_range"] = uncertainty.format_range(total_range)
+        quote["price_range"]["samples"] = n_samples
     return quote
 
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description="Donizo Smart Bathroom Pricing Engine")
     parser.add_argument("--transcript", type=str, help="Renovation transcript")
@@ -274,6 +319,33 @@ def main():
     parser.add_argument(
         "--print-feedback", action="store_true", help="Print all feedback entries"
     )
+    parser.add_argument(
+        "--price-ranges",
+        action="store_true",
+        help="Attach Monte Carlo P10/P50/P90 price ranges to each task and the total",
+    )
+    parser.add_argument(
+        "--samples",
+        type=positive_int,
+        default=uncertainty.DEFAULT_SAMPLES,
+        help="Number of Monte Carlo samples used with --price-ranges",
+    )
+    parser.add_argument(
+        "--export-analytics",
+        action="store_true",
+        help="Append new quotes from output/ to the columnar analytics tables",
+    )
+    parser.add_argument(
+        "--print-rollup",
+        choices=sorted(analytics.ROLLUPS),
+        help="Print a pre-aggregated analytics rollup",
+    )
+    parser.add_argument(
+        "--capture-log",
+        type=str,
+        default=os.environ.get("PRICING_CAPTURE_LOG"),
+        help="Append each transcript and city to this traffic log for shadow replays",
+    )
     args = parser.parse_args()
 
     if args.add_feedback:
@@ -282,19 +354,33 @@ def main():
     if args.print_feedback:
         feedback_memory.FeedbackMemory().print_feedback()
         return
+    if args.export_analytics or args.print_rollup:
+        store = analytics.QuoteAnalytics()
+        if args.export_analytics:
+            added = store.export_output_dir()
+            print(f"Exported {added} new quote(s) to the analytics tables")
+        if args.print_rollup:
+            store.print_rollup(args.print_rollup)
+        return
     if not args.transcript:
         print(
-            "Error: --transcript is required unless using --add-feedback or --print-feedback."
+            "Error: --transcript is required unless using --add-feedback, --print-feedback,"
+            " --export-analytics or --print-rollup."
         )
         return
 
+    if args.capture_log:
+        shadow.TrafficLog(args.capture_log).record(args.transcript, args.city)
+
     # Parse transcript and extract city if not provided
     parser_nlp = NLPTranscriptParser()
     tasks, _, extracted_city = parser_nlp.parse(args.transcript)
     city = args.city if args.city else extracted_city
     if not city:
         city = "Marseille"  # fallback default
-    quote = generate_quote(tasks, city)
+    quote = generate_quote(
+        tasks, city, price_ranges=args.price_ranges, n_samples=args.samples
+    )
 
     # Generate unique quote ID (timestamp-based)
     quote_id = datetime.datetime.now().strftime("quote_%Y-%m-%dT%H-%M-%S")
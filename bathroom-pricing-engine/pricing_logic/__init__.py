@@ -3,3 +3,6 @@ from .labor_calc import LaborCalc
 from .vat_rules import get_vat_rate
 from .city_pricing import get_city_labor_rate, get_city_material_multiplier
 from .feedback_memory import FeedbackMemory
+from .uncertainty import PriceRangeEstimator
+from .analytics import QuoteAnalytics
+from .shadow import TrafficLog
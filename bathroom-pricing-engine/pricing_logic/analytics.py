@@ -0,0 +1,360 @@
+"""
+Analytics Export Logic
+Flattens generated quotes into columnar tables (quotes, tasks, materials)
+and maintains pre-aggregated rollups by city, task, material and day.
+Tables are written as Parquet when pyarrow is installed, otherwise as
+NumPy .npz column files. Each export appends new part files, which are
+only read once listed in the manifest.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import uuid
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock on Windows; concurrent exports are not supported there
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "../output")
+ANALYTICS_DIR = os.path.join(os.path.dirname(__file__), "../analytics")
+
+TABLES = {
+    "quotes": [
+        "quote_id",
+        "day",
+        "city",
+        "n_tasks",
+        "total",
+        "vat_total",
+        "margin_total",
+        "confidence",
+        "error_flag",
+    ],
+    "tasks": [
+        "quote_id",
+        "day",
+        "city",
+        "task",
+        "labor_hours",
+        "labor_total",
+        "vat_rate",
+        "margin",
+        "total_price",
+        "confidence",
+        "error_flag",
+    ],
+    "materials": [
+        "quote_id",
+        "day",
+        "city",
+        "task",
+        "material",
+        "unit",
+        "quantity",
+        "unit_price",
+        "total",
+    ],
+}
+STRING_COLUMNS = {"quote_id", "day", "city", "task", "material", "unit"}
+BOOL_COLUMNS = {"error_flag"}
+
+# rollup name -> (table, group-by columns, summed value column)
+ROLLUPS = {
+    "city": ("quotes", ("city",), "total"),
+    "day": ("quotes", ("day",), "total"),
+    "city_day": ("quotes", ("city", "day"), "total"),
+    "task": ("tasks", ("task",), "total_price"),
+    "material": ("materials", ("material",), "total"),
+}
+KEY_SEPARATOR = "|"
+
+
+def quote_day(quote_id):
+    """
+    Returns the ISO day a quote was generated, from its timestamped ID.
+    """
+    try:
+        stamp = datetime.datetime.strptime(quote_id, "quote_%Y-%m-%dT%H-%M-%S")
+    except ValueError:
+        return ""
+    return stamp.date().isoformat()
+
+
+def flatten_quote(quote_id, quote):
+    """
+    Returns (quote_row, task_rows, material_rows) for one quote.
+    """
+    day = quote_day(quote_id)
+    city = quote.get("city") or ""
+    tasks = quote.get("tasks", [])
+    quote_row = {
+        "quote_id": quote_id,
+        "day": day,
+        "city": city,
+        "n_tasks": len(tasks),
+        "total": quote.get("total"),
+        "vat_total": quote.get("vat_total"),
+        "margin_total": quote.get("margin_total"),
+        "confidence": quote.get("confidence"),
+        "error_flag": bool(quote.get("error_flag", False)),
+    }
+    task_rows = []
+    material_rows = []
+    for task in tasks:
+        labor = task.get("labor", {})
+        confidence = task.get("confidence", 1.0)
+        task_rows.append(
+            {
+                "quote_id": quote_id,
+                "day": day,
+                "city": city,
+                "task": task.get("name", ""),
+                "labor_hours": labor.get("hours"),
+                "labor_total": labor.get("total"),
+                "vat_rate": task.get("vat_rate"),
+                "margin": task.get("margin"),
+                "total_price": task.get("total_price"),
+                "confidence": confidence,
+                # Task confidence is only lowered by missing materials or labor templates
+                "error_flag": confidence is not None and confidence < 1.0,
+            }
+        )
+        for mat in task.get("materials", []):
+            material_rows.append(
+                {
+                    "quote_id": quote_id,
+                    "day": day,
+                    "city": city,
+                    "task": task.get("name", ""),
+                    "material": mat.get("name", ""),
+                    "unit": mat.get("unit") or "",
+                    "quantity": mat.get("quantity"),
+                    "unit_price": mat.get("unit_price"),
+                    "total": mat.get("total"),
+                }
+            )
+    return quote_row, task_rows, material_rows
+
+
+def _to_columns(table, rows):
+    columns = {}
+    for col in TABLES[table]:
+        values = [row[col] for row in rows]
+        if col in STRING_COLUMNS:
+            columns[col] = np.array(values, dtype=str)
+        elif col in BOOL_COLUMNS:
+            columns[col] = np.array(values, dtype=bool)
+        else:
+            columns[col] = np.array(
+                [np.nan if v is None else v for v in values], dtype=float
+            )
+    return columns
+
+
+def _group_stats(columns, keys, value_col):
+    """
+    Sums a value column per distinct key combination with NumPy group-by.
+    """
+    if len(columns[value_col]) == 0:
+        return {}
+    key_values = [columns[k] for k in keys]
+    joined = key_values[0]
+    for extra in key_values[1:]:
+        joined = np.char.add(np.char.add(joined, KEY_SEPARATOR), extra)
+    groups, inverse = np.unique(joined, return_inverse=True)
+    values = np.nan_to_num(columns[value_col])
+    counts = np.bincount(inverse, minlength=len(groups))
+    totals = np.bincount(inverse, weights=values, minlength=len(groups))
+    stats = {
+        str(group): {"count": int(counts[i]), "total": float(totals[i])}
+        for i, group in enumerate(groups)
+    }
+    # Only tables with an error column get an error count
+    if "error_flag" in columns:
+        errors = np.bincount(
+            inverse, weights=columns["error_flag"], minlength=len(groups)
+        )
+        for i, group in enumerate(groups):
+            stats[str(group)]["errors"] = int(errors[i])
+    return stats
+
+
+class QuoteAnalytics:
+    def __init__(self, analytics_dir=ANALYTICS_DIR, fmt=None):
+        self.analytics_dir = analytics_dir
+        self.format = fmt or ("parquet" if pq is not None else "npz")
+        if self.format == "parquet" and pq is None:
+            raise ValueError("Parquet export requires pyarrow to be installed.")
+        self.manifest_path = os.path.join(analytics_dir, "manifest.json")
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {"quote_ids": [], "parts": [], "rollups": {}}
+
+    def save_manifest(self):
+        # Write then rename, so a crash never leaves a truncated manifest
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Serializes exports across processes while the manifest is updated.
+        """
+        os.makedirs(self.analytics_dir, exist_ok=True)
+        with open(os.path.join(self.analytics_dir, "manifest.lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, quotes):
+        """
+        Appends quotes ({quote_id: quote}) not yet exported as a new part
+        and folds them into the rollups. Returns the number of quotes added.
+        """
+        with self._locked():
+            # Another process may have exported since this store was opened
+            self.manifest = self.load_manifest()
+            return self._append(quotes)
+
+    def _append(self, quotes):
+        known = set(self.manifest["quote_ids"])
+        rows = {table: [] for table in TABLES}
+        new_ids = []
+        for quote_id, quote in quotes.items():
+            if quote_id in known:
+                continue
+            quote_row, task_rows, material_rows = flatten_quote(quote_id, quote)
+            rows["quotes"].append(quote_row)
+            rows["tasks"].extend(task_rows)
+            rows["materials"].extend(material_rows)
+            new_ids.append(quote_id)
+        if not new_ids:
+            return 0
+        ext = "parquet" if self.format == "parquet" else "npz"
+        # Unique names: parts of an interrupted export are never picked up or overwritten
+        part = f"part-{uuid.uuid4().hex}.{ext}"
+        batch = {}
+        for table in TABLES:
+            batch[table] = _to_columns(table, rows[table])
+            self._write_part(table, part, batch[table])
+        for name, (table, keys, value_col) in ROLLUPS.items():
+            rollup = self.manifest["rollups"].setdefault(name, {})
+            for key, stats in _group_stats(batch[table], keys, value_col).items():
+                entry = rollup.setdefault(key, dict.fromkeys(stats, 0))
+                for field, value in stats.items():
+                    entry[field] += value
+        self.manifest["quote_ids"].extend(new_ids)
+        self.manifest["parts"].append(part)
+        self.save_manifest()
+        return len(new_ids)
+
+    def export_output_dir(self, output_dir=OUTPUT_DIR):
+        """
+        Incrementally exports every quote_<timestamp>.json file in output_dir.
+        """
+        known = set(self.manifest["quote_ids"])
+        quotes = {}
+        for fname in sorted(os.listdir(output_dir)):
+            quote_id, ext = os.path.splitext(fname)
+            # Only timestamped quote files; skips e.g. sample_quote.json
+            if ext != ".json" or not quote_day(quote_id) or quote_id in known:
+                continue
+            try:
+                with open(os.path.join(output_dir, fname), "r") as f:
+                    quotes[quote_id] = json.load(f)
+            except Exception as e:
+                print(f"Warning: Could not read quote '{fname}': {e}")
+        return self.append(quotes)
+
+    def _part_path(self, table, part):
+        return os.path.join(self.analytics_dir, table, part)
+
+    def _write_part(self, table, part, columns):
+        path = self._part_path(table, part)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.format == "parquet":
+            pq.write_table(pa.table(columns), path)
+        else:
+            np.savez(path, **columns)
+
+    def load_table(self, table, columns=None):
+        """
+        Returns a table as {column: numpy array}, reading only the requested
+        columns of the parts recorded in the manifest.
+        """
+        columns = columns or TABLES[table]
+        parts = {col: [] for col in columns}
+        for part in self.manifest["parts"]:
+            path = self._part_path(table, part)
+            if part.endswith(".parquet"):
+                if pq is None:
+                    raise ValueError(
+                        f"Reading '{path}' requires pyarrow to be installed."
+                    )
+                data = pq.read_table(path, columns=columns)
+                for col in columns:
+                    parts[col].append(data.column(col).to_numpy())
+            else:
+                with np.load(path) as data:
+                    for col in columns:
+                        parts[col].append(data[col])
+        table_columns = {}
+        for col, chunks in parts.items():
+            values = np.concatenate(chunks) if chunks else np.array([])
+            # Parquet yields object arrays for strings; match the npz '<U' dtype
+            if col in STRING_COLUMNS:
+                values = values.astype(str)
+            elif col in BOOL_COLUMNS:
+                values = values.astype(bool)
+            table_columns[col] = values
+        return table_columns
+
+    def rollup(self, name):
+        """
+        Returns a pre-aggregated rollup as {key: {count, total, average}}, plus
+        'errors' for rollups over quotes and tasks. Multi-column keys
+        (e.g. city_day) are joined with '|'.
+        """
+        if name not in ROLLUPS:
+            raise ValueError(f"Unknown rollup '{name}'. Available: {sorted(ROLLUPS)}")
+        return {
+            key: dict(stats, average=stats["total"] / stats["count"])
+            for key, stats in self.manifest["rollups"].get(name, {}).items()
+        }
+
+    def print_rollup(self, name):
+        print(f"Rollup by {name}:")
+        rollup = self.rollup(name)
+        if not rollup:
+            print("(No quotes exported yet)")
+        for key, stats in sorted(rollup.items()):
+            line = (
+                f"- {key or '(unknown)'}: {stats['count']} rows, "
+                f"avg {stats['average']:.2f}"
+            )
+            if "errors" in stats:
+                line += f", {stats['errors']} with errors"
+            print(line)
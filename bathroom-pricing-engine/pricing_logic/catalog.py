@@ -0,0 +1,21 @@
+"""
+Catalog Location
+Resolves pricing data files. Setting PRICING_DATA_DIR points the engine at
+another catalog snapshot, e.g. for shadow replays. Feedback memory is not
+part of the catalog and always stays in the engine's own data directory.
+"""
+
+import os
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
+CATALOG_FILES = (
+    "materials.json",
+    "price_templates.csv",
+    "city_multipliers.json",
+    "uncertainty.json",
+)
+DATA_DIR = os.environ.get("PRICING_DATA_DIR", DEFAULT_DATA_DIR)
+
+
+def catalog_path(filename):
+    return os.path.join(DATA_DIR, filename)
@@ -4,9 +4,9 @@ Provides city-based multipliers for labor and materials.
 """
 
 import json
-import os
+from .catalog import catalog_path
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), "../data/city_multipliers.json")
+DATA_PATH = catalog_path("city_multipliers.json")
 
 _city_data = None
 
@@ -4,11 +4,11 @@ Estimates labor time and cost for tasks, with city-based adjustments.
 """
 
 import csv
-import os
 import re
 from .city_pricing import get_city_labor_rate
+from .catalog import catalog_path
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), "../data/price_templates.csv")
+DATA_PATH = catalog_path("price_templates.csv")
 
 
 class LaborCalc:
@@ -50,26 +50,34 @@ class LaborCalc:
         task = re.sub(r"[^a-z\s]", "", task)
         return " ".join(task.split())
 
-    def estimate_labor(self, task_name, city):
+    def match_template(self, task_name):
+        """
+        Returns (template_name, template) for a task, or (None, None) if no match.
+        """
         # Try exact match first
         key = task_name.strip().lower()
         template = self.templates.get(key)
+        if template:
+            return key, template
         # Fuzzy/partial match if not found
-        if not template:
-            norm_key = self._normalize_task(key)
-            best_match = None
-            best_score = 0
-            for tname, entry in self.templates.items():
-                norm_tname = self._normalize_task(tname)
-                # Token overlap score
-                key_tokens = set(norm_key.split())
-                tname_tokens = set(norm_tname.split())
-                score = len(key_tokens & tname_tokens)
-                if score > best_score:
-                    best_score = score
-                    best_match = entry
-            if best_match and best_score > 0:
-                template = best_match
+        norm_key = self._normalize_task(key)
+        best_name = None
+        best_score = 0
+        for tname in self.templates:
+            norm_tname = self._normalize_task(tname)
+            # Token overlap score
+            key_tokens = set(norm_key.split())
+            tname_tokens = set(norm_tname.split())
+            score = len(key_tokens & tname_tokens)
+            if score > best_score:
+                best_score = score
+                best_name = tname
+        if best_name and best_score > 0:
+            return best_name, self.templates[best_name]
+        return None, None
+
+    def estimate_labor(self, task_name, city):
+        _, template = self.match_template(task_name)
         if not template:
             print(f"Warning: No labor template found for task '{task_name}'.")
             return None, None
@@ -4,9 +4,9 @@ Loads and provides access to material prices and details.
 """
 
 import json
-import os
+from .catalog import catalog_path
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), "../data/materials.json")
+DATA_PATH = catalog_path("materials.json")
 
 
 class MaterialDB:
@@ -46,6 +46,13 @@ class MaterialDB:
             return None
         return entry.get("unit")
 
+    def get_waste_factor(self, material_name):
+        """
+        Returns the expected waste factor for area-based materials (1.0 if none).
+        """
+        entry = self.materials.get(material_name) or {}
+        return entry.get("waste_factor", 1.0)
+
     def exists(self, material_name):
         return material_name in self.materials
 
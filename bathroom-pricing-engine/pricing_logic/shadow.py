@@ -0,0 +1,193 @@
+"""
+Shadow Testing Logic
+Captures incoming transcripts to a traffic log and compares the quotes and
+stage latencies produced by two engine versions replaying that log.
+"""
+
+import datetime
+import json
+import numpy as np
+
+LATENCY_PERCENTILES = (50, 90, 99)
+# Price differences below this are treated as rounding noise
+PRICE_TOLERANCE = 0.01
+
+
+class TrafficLog:
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def record(self, transcript, city=None, timestamp=None):
+        """
+        Appends one incoming request (transcript, CLI city, timestamp) as a JSON line.
+        """
+        timestamp = timestamp or datetime.datetime.now()
+        entry = {
+            "timestamp": timestamp.isoformat(),
+            "transcript": transcript,
+            "city": city,
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def load(self):
+        records = []
+        try:
+            with open(self.log_path, "r") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        entry["timestamp"] = datetime.datetime.fromisoformat(
+                            entry["timestamp"]
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        print(f"Warning: Malformed traffic log line {line_no}.")
+                        continue
+                    if not entry.get("transcript"):
+                        print(f"Warning: Traffic log line {line_no} has no transcript.")
+                        continue
+                    records.append(entry)
+        except Exception as e:
+            print(f"Error loading traffic log: {e}")
+        return records
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _changed(a, b):
+    if not (_is_number(a) and _is_number(b)):
+        return a != b
+    return abs(a - b) > PRICE_TOLERANCE
+
+
+def _delta(before, after):
+    # Older or broken engines may omit prices; no delta rather than a crash
+    if not (_is_number(before) and _is_number(after)):
+        return None
+    return round(after - before, 2)
+
+
+def diff_quotes(baseline, candidate):
+    """
+    Compares two quotes for the same request. Tasks are matched by name.
+    """
+    base_tasks = {t["name"]: t for t in baseline.get("tasks", [])}
+    cand_tasks = {t["name"]: t for t in candidate.get("tasks", [])}
+    task_diffs = []
+    for name in sorted(base_tasks.keys() & cand_tasks.keys()):
+        before = base_tasks[name].get("total_price")
+        after = cand_tasks[name].get("total_price")
+        if _changed(before, after):
+            task_diffs.append(
+                {
+                    "name": name,
+                    "baseline": before,
+                    "candidate": after,
+                    "delta": _delta(before, after),
+                }
+            )
+    diff = {
+        "total": {
+            "baseline": baseline.get("total"),
+            "candidate": candidate.get("total"),
+            "delta": _delta(baseline.get("total"), candidate.get("total")),
+        },
+        "tasks_added": sorted(cand_tasks.keys() - base_tasks.keys()),
+        "tasks_removed": sorted(base_tasks.keys() - cand_tasks.keys()),
+        "tasks_changed": task_diffs,
+        "error_flag": {
+            "baseline": baseline.get("error_flag"),
+            "candidate": candidate.get("error_flag"),
+        },
+        "confidence": {
+            "baseline": baseline.get("confidence"),
+            "candidate": candidate.get("confidence"),
+        },
+    }
+    diff["changed"] = bool(
+        _changed(diff["total"]["baseline"], diff["total"]["candidate"])
+        or diff["tasks_added"]
+        or diff["tasks_removed"]
+        or task_diffs
+        or diff["error_flag"]["baseline"] != diff["error_flag"]["candidate"]
+        or diff["confidence"]["baseline"] != diff["confidence"]["candidate"]
+    )
+    return diff
+
+
+def summarize_latencies(timings):
+    """
+    Returns per-stage latency stats (ms) from a list of {stage: ms} dicts.
+    """
+    stages = sorted({stage for t in timings for stage in t})
+    summary = {}
+    for stage in stages:
+        values = np.array([t[stage] for t in timings if stage in t], dtype=float)
+        percentiles = np.percentile(values, LATENCY_PERCENTILES)
+        summary[stage] = {
+            "count": int(len(values)),
+            "mean": round(float(values.mean()), 3),
+            "max": round(float(values.max()), 3),
+        }
+        for p, value in zip(LATENCY_PERCENTILES, percentiles):
+            summary[stage][f"p{p}"] = round(float(value), 3)
+    return summary
+
+
+def build_report(records, baseline_results, candidate_results):
+    """
+    Builds the replay report from per-record worker results, each being
+    {"quote": ..., "timings": ...} or {"error": ...} (or None if missing).
+    """
+    quotes = []
+    counts = {
+        "requests": len(records),
+        "changed": 0,
+        "total_changed": 0,
+        "error_flag_changed": 0,
+        "confidence_changed": 0,
+        "failed": 0,
+    }
+    for i, record in enumerate(records):
+        base = baseline_results[i] or {"error": "no result"}
+        cand = candidate_results[i] or {"error": "no result"}
+        entry = {
+            "timestamp": record["timestamp"].isoformat(),
+            "city": record.get("city"),
+            "transcript": record["transcript"],
+        }
+        if "error" in base or "error" in cand:
+            counts["failed"] += 1
+            entry["baseline_error"] = base.get("error")
+            entry["candidate_error"] = cand.get("error")
+            quotes.append(entry)
+            continue
+        diff = diff_quotes(base["quote"], cand["quote"])
+        entry["diff"] = diff
+        counts["changed"] += diff["changed"]
+        counts["total_changed"] += _changed(
+            diff["total"]["baseline"], diff["total"]["candidate"]
+        )
+        counts["error_flag_changed"] += (
+            diff["error_flag"]["baseline"] != diff["error_flag"]["candidate"]
+        )
+        counts["confidence_changed"] += (
+            diff["confidence"]["baseline"] != diff["confidence"]["candidate"]
+        )
+        quotes.append(entry)
+    return {
+        "summary": counts,
+        "latency_ms": {
+            "baseline": summarize_latencies(
+                [r["timings"] for r in baseline_results if r and "timings" in r]
+            ),
+            "candidate": summarize_latencies(
+                [r["timings"] for r in candidate_results if r and "timings" in r]
+            ),
+        },
+        "quotes": quotes,
+    }
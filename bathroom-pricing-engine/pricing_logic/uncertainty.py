@@ -0,0 +1,188 @@
+"""
+Uncertainty Logic
+Monte Carlo price ranges (P10/P50/P90) for quotes.
+Labor hours, material prices and quantities are sampled from triangular
+multiplier distributions loaded from data, all in batched NumPy arrays.
+Multipliers are relative to the quoted value, with the quote as the mode;
+right-skewed entries (e.g. labor overruns) put the range above the quote.
+Waste factors are absolute (>= 1.0) and sampled against the catalog waste
+already included in the quoted quantity.
+"""
+
+import json
+import numpy as np
+from .catalog import catalog_path
+
+DATA_PATH = catalog_path("uncertainty.json")
+
+DEFAULT_SAMPLES = 20000
+PERCENTILES = (10, 50, 90)
+# Used when a parameter has no distribution at all: no variation
+FIXED = (1.0, 1.0, 1.0)
+
+
+def _triangular(u, low, mode, high):
+    """
+    Inverse CDF of the triangular distribution, vectorized over arrays.
+    Unlike numpy's sampler this accepts degenerate (low == high) distributions.
+    """
+    width = high - low
+    split = np.divide(mode - low, width, out=np.zeros_like(width), where=width > 0)
+    lower = u < split
+    # Single sqrt over both branches: distance from the nearer end of the support
+    offset = np.sqrt(np.where(lower, u * split, (1 - u) * (1 - split))) * width
+    return np.where(lower, low + offset, high - offset)
+
+
+class PriceRangeEstimator:
+    def __init__(
+        self, data_path=DATA_PATH, n_samples=DEFAULT_SAMPLES, seed=None, centred=False
+    ):
+        if not isinstance(n_samples, int) or n_samples < 1:
+            raise ValueError(
+                f"n_samples must be a positive integer, got {n_samples!r}."
+            )
+        # centred=True rescales multipliers to mean 1.0, dropping their skew
+        self.centred = centred
+        self.distributions = self.load_distributions(data_path)
+        self.n_samples = n_samples
+        self.rng = np.random.default_rng(seed)
+
+    def load_distributions(self, path):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading uncertainty distributions: {e}")
+            data = {}
+        distributions = {
+            "defaults": {},
+            "templates": {},
+            "materials": {},
+        }
+        for section in distributions:
+            for name, entry in data.get(section, {}).items():
+                if section == "defaults":
+                    parsed = self._parse_distribution(name, name, entry)
+                    if parsed:
+                        distributions[section][name] = parsed
+                    continue
+                if not isinstance(entry, dict):
+                    print(
+                        f"Warning: Uncertainty entry '{name}' in '{section}' is malformed."
+                    )
+                    continue
+                parsed_entry = {}
+                for param, dist in entry.items():
+                    parsed = self._parse_distribution(f"{name}.{param}", param, dist)
+                    if parsed:
+                        parsed_entry[param] = parsed
+                key = name.strip().lower() if section == "templates" else name
+                distributions[section][key] = parsed_entry
+        return distributions
+
+    def _parse_distribution(self, name, param, dist):
+        try:
+            low = float(dist["low"])
+            high = float(dist["high"])
+            mode = float(dist.get("mode", 1.0))
+        except (TypeError, KeyError, ValueError):
+            print(f"Warning: Uncertainty distribution '{name}' is malformed.")
+            return None
+        if not 0 < low <= mode <= high:
+            print(
+                f"Warning: Uncertainty distribution '{name}' must satisfy 0 < low <= mode <= high."
+            )
+            return None
+        if param == "waste_factor":
+            if low < 1.0:
+                print(
+                    f"Warning: Waste factor '{name}' must not go below 1.0; ignoring it."
+                )
+                return None
+            return (low, mode, high)
+        if self.centred:
+            mean = (low + mode + high) / 3
+            return (low / mean, mode / mean, high / mean)
+        return (low, mode, high)
+
+    def get_distribution(self, param, template_name=None, material_name=None):
+        """
+        Returns the (low, mode, high) multiplier for a parameter, preferring
+        per-template / per-material entries over the defaults.
+        """
+        if template_name is not None:
+            entry = self.distributions["templates"].get(template_name.strip().lower())
+            if entry and param in entry:
+                return entry[param]
+        if material_name is not None:
+            entry = self.distributions["materials"].get(material_name)
+            if entry and param in entry:
+                return entry[param]
+        return self.distributions["defaults"].get(param, FIXED)
+
+    def estimate(self, task_inputs):
+        """
+        Samples price distributions for a list of priced tasks.
+
+        Each task input is a dict with 'template', 'labor_cost', 'materials'
+        (dicts with 'name', 'cost', 'area_based' and optionally the
+        'waste_factor' included in cost), 'margin' and 'vat_rate'.
+        Returns (task_ranges, total_range), each range being (p10, p50, p90).
+        """
+        n = self.n_samples
+        n_tasks = len(task_inputs)
+        lines = [
+            (i, mat) for i, task in enumerate(task_inputs) for mat in task["materials"]
+        ]
+
+        # Per-task labor: base cost scaled by an hours multiplier
+        labor_cost = np.array([t["labor_cost"] for t in task_inputs], dtype=float)
+        labor_dist = np.array(
+            [self.get_distribution("labor_hours", t.get("template")) for t in task_inputs],
+            dtype=float,
+        ).reshape(n_tasks, 3)
+        hours_factor = _triangular(self.rng.random((n, n_tasks)), *labor_dist.T)
+        task_subtotal = labor_cost * hours_factor
+
+        # Per-line materials: price multiplier, plus room size and waste for area-based lines
+        if lines:
+            mat_cost = np.array([mat["cost"] for _, mat in lines], dtype=float)
+            area_based = np.array([mat["area_based"] for _, mat in lines], dtype=bool)
+            price_dist = np.array(
+                [self.get_distribution("unit_price", material_name=m["name"]) for _, m in lines],
+                dtype=float,
+            )
+            waste_dist = np.array(
+                [self.get_distribution("waste_factor", material_name=m["name"]) for _, m in lines],
+                dtype=float,
+            )
+            # The room is the same for every task of a quote: one draw per sample
+            room_factor = _triangular(
+                self.rng.random((n, 1)), *np.array(self.get_distribution("room_size_m2"))
+            )
+            price_factor = _triangular(self.rng.random((n, len(lines))), *price_dist.T)
+            waste_factor = _triangular(self.rng.random((n, len(lines))), *waste_dist.T)
+            quoted_waste = np.array(
+                [mat.get("waste_factor", 1.0) for _, mat in lines], dtype=float
+            )
+            quantity_factor = np.where(
+                area_based, room_factor * waste_factor / quoted_waste, 1.0
+            )
+            line_totals = mat_cost * price_factor * quantity_factor
+            line_to_task = np.zeros((len(lines), n_tasks))
+            line_to_task[np.arange(len(lines)), [i for i, _ in lines]] = 1.0
+            task_subtotal += line_totals @ line_to_task
+
+        markup = np.array(
+            [(1 + t["margin"]) * (1 + t["vat_rate"]) for t in task_inputs], dtype=float
+        )
+        task_totals = task_subtotal * markup
+        task_ranges = np.percentile(task_totals, PERCENTILES, axis=0).T.tolist()
+        total_range = np.percentile(task_totals.sum(axis=1), PERCENTILES).tolist()
+        return task_ranges, total_range
+
+
+def format_range(price_range):
+    p10, p50, p90 = price_range
+    return {"p10": round(p10, 2), "p50": round(p50, 2), "p90": round(p90, 2)}
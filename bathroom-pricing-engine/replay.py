@@ -0,0 +1,213 @@
+"""
+Donizo Shadow Replay
+
+Replays a captured traffic log through a baseline and a candidate engine
+(code checkout and/or catalog snapshot) in parallel, and writes a report of
+quote diffs and per-stage latency distributions.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pricing_logic import shadow
+from pricing_logic.catalog import CATALOG_FILES
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_PATH = os.path.join(ENGINE_DIR, "replay_worker.py")
+REPORT_PATH = "replay_report.json"
+
+
+class EngineWorker:
+    """
+    One engine version running in its own process, so two checkouts of
+    pricing_engine / pricing_logic can be compared side by side.
+    """
+
+    def __init__(self, name, engine_dir, data_dir=None, verbose=False):
+        self.name = name
+        self.results = {}
+        env = dict(os.environ)
+        if data_dir:
+            data_dir = os.path.abspath(data_dir)
+            for fname in CATALOG_FILES:
+                if not os.path.exists(os.path.join(data_dir, fname)):
+                    print(
+                        f"Warning: {name} catalog snapshot has no '{fname}'; "
+                        "that data will load empty."
+                    )
+            env["PRICING_DATA_DIR"] = data_dir
+        engine_dir = os.path.abspath(engine_dir)
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_PATH, "--engine-dir", engine_dir],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None if verbose else subprocess.DEVNULL,
+            cwd=engine_dir,
+            env=env,
+            text=True,
+        )
+        self.reader = None
+        self.alive = True
+
+    def wait_ready(self):
+        line = self.proc.stdout.readline()
+        message = json.loads(line) if line else {"fatal": "worker exited on startup"}
+        if not message.get("ready"):
+            raise RuntimeError(
+                f"{self.name} engine failed to start:\n{message.get('fatal')}"
+            )
+        self.reader = threading.Thread(target=self._read_results, daemon=True)
+        self.reader.start()
+
+    def _read_results(self):
+        for line in self.proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                # Partial line from a worker that died mid-write
+                break
+            self.results[message["id"]] = message
+
+    def send(self, request_id, record):
+        request = {
+            "id": request_id,
+            "transcript": record["transcript"],
+            "city": record.get("city"),
+        }
+        if not self.alive:
+            return
+        try:
+            self.proc.stdin.write(json.dumps(request) + "\n")
+            self.proc.stdin.flush()
+        except OSError:
+            # Requests not answered from here on are reported as failed
+            print(f"Warning: {self.name} engine exited during the replay.")
+            self.alive = False
+
+    def finish(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        if self.reader is not None:
+            self.reader.join()
+        self.proc.wait()
+
+
+def replay(records, baseline, candidate, speed=0.0):
+    """
+    Feeds records to both workers. With speed > 0, requests are paced by
+    their captured timestamps (speed=1 is real time, 10 is ten times faster);
+    speed=0 sends them as fast as possible.
+    Returns (baseline_results, candidate_results) aligned with records.
+    """
+    workers = (baseline, candidate)
+    try:
+        for worker in workers:
+            worker.wait_ready()
+        start = time.monotonic()
+        first = records[0]["timestamp"] if records else None
+        for i, record in enumerate(records):
+            if speed > 0:
+                offset = (record["timestamp"] - first).total_seconds() / speed
+                delay = offset - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            for worker in workers:
+                worker.send(i, record)
+    except BaseException:
+        for worker in workers:
+            worker.proc.kill()
+        raise
+    finally:
+        for worker in workers:
+            worker.finish()
+    return tuple(
+        [worker.results.get(i) for i in range(len(records))] for worker in workers
+    )
+
+
+def print_summary(report):
+    summary = report["summary"]
+    print(
+        f"Replayed {summary['requests']} request(s): {summary['changed']} changed, "
+        f"{summary['total_changed']} total diffs, "
+        f"{summary['error_flag_changed']} error_flag flips, "
+        f"{summary['confidence_changed']} confidence changes, "
+        f"{summary['failed']} failed."
+    )
+    for name, stages in report["latency_ms"].items():
+        for stage, stats in stages.items():
+            print(
+                f"- {name} {stage}: p50 {stats['p50']:.1f} ms, "
+                f"p90 {stats['p90']:.1f} ms, p99 {stats['p99']:.1f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Donizo shadow replay")
+    parser.add_argument(
+        "--log", required=True, help="Traffic log captured with --capture-log"
+    )
+    parser.add_argument(
+        "--baseline-engine", default=ENGINE_DIR, help="Baseline engine directory"
+    )
+    parser.add_argument(
+        "--candidate-engine", default=ENGINE_DIR, help="Candidate engine directory"
+    )
+    parser.add_argument(
+        "--baseline-data", default=None, help="Catalog snapshot for the baseline"
+    )
+    parser.add_argument(
+        "--candidate-data", default=None, help="Catalog snapshot for the candidate"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Replay speed relative to capture (1 = real time, 0 = as fast as possible)",
+    )
+    parser.add_argument("--report", default=REPORT_PATH, help="Report output path")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show engine warnings from the workers"
+    )
+    args = parser.parse_args()
+
+    records = shadow.TrafficLog(args.log).load()
+    if not records:
+        print("Error: traffic log is empty.")
+        return
+    workers = []
+    try:
+        workers.append(
+            EngineWorker(
+                "baseline", args.baseline_engine, args.baseline_data, args.verbose
+            )
+        )
+        workers.append(
+            EngineWorker(
+                "candidate", args.candidate_engine, args.candidate_data, args.verbose
+            )
+        )
+        baseline_results, candidate_results = replay(records, *workers, args.speed)
+    except (OSError, RuntimeError) as e:
+        # e.g. a bad engine path: don't leave the other worker running
+        for worker in workers:
+            if worker.proc.poll() is None:
+                worker.proc.kill()
+                worker.proc.wait()
+        print(f"Error: {e}")
+        return
+    report = shadow.build_report(records, baseline_results, candidate_results)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
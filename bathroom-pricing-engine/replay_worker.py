@@ -0,0 +1,72 @@
+"""
+Replay worker: runs one engine version over requests read from stdin.
+
+Started by replay.py with the engine directory first on sys.path, so it must
+not import pricing_logic itself. Protocol: JSON lines in
+({"id", "transcript", "city"}), JSON lines out ({"id", "quote", "timings"}
+or {"id", "error"}), preceded by a single {"ready": true} line.
+"""
+
+import argparse
+import json
+import sys
+import time
+import traceback
+
+
+def _elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay worker for one engine version")
+    parser.add_argument(
+        "--engine-dir", required=True, help="Directory with pricing_engine.py"
+    )
+    args = parser.parse_args()
+
+    # Engine warnings are printed to stdout; keep the protocol stream clean
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    sys.path.insert(0, args.engine_dir)
+    try:
+        import pricing_engine
+
+        nlp_parser = pricing_engine.NLPTranscriptParser()
+    except Exception:
+        emit({"fatal": traceback.format_exc()})
+        return
+    emit({"ready": True})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            start = time.perf_counter()
+            tasks, _, extracted_city = nlp_parser.parse(request["transcript"])
+            parse_ms = _elapsed_ms(start)
+            # Same city fallback as pricing_engine.main
+            city = request.get("city") or extracted_city or "Marseille"
+            quote_start = time.perf_counter()
+            quote = pricing_engine.generate_quote(tasks, city)
+            emit(
+                {
+                    "id": request["id"],
+                    "quote": quote,
+                    "timings": {
+                        "parse": parse_ms,
+                        "quote": _elapsed_ms(quote_start),
+                        "total": _elapsed_ms(start),
+                    },
+                }
+            )
+        except Exception as e:
+            emit({"id": request["id"], "error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,43 @@
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import textwrap
 import unittest
+from unittest import mock
+import numpy as np
 from pricing_logic import (
     MaterialDB,
     LaborCalc,
     get_vat_rate,
     get_city_labor_rate,
     FeedbackMemory,
+    PriceRangeEstimator,
+    QuoteAnalytics,
+    TrafficLog,
 )
+from pricing_logic import analytics
+from pricing_logic.shadow import build_report, diff_quotes
+import replay
+
+FAKE_ENGINE = """
+import os
+
+
+class NLPTranscriptParser:
+    def parse(self, transcript):
+        if transcript == os.environ.get("CRASH_ON"):
+            os._exit(1)
+        return [], None, None
+
+
+def generate_quote(tasks, city):
+    return {"city": city, "tasks": [], "total": 0.0, "confidence": 1.0}
+"""
 
 
 class TestPricingLogic(unittest.TestCase):
@@ -18,6 +50,11 @@ class TestPricingLogic(unittest.TestCase):
         self.assertEqual(self.material_db.get_price("Disposal bags"), 2)
         self.assertIsNone(self.material_db.get_price("Nonexistent"))
 
+    def test_material_waste_factor(self):
+        self.assertAlmostEqual(self.material_db.get_waste_factor("Ceramic tiles"), 1.1)
+        self.assertEqual(self.material_db.get_waste_factor("Toilet"), 1.0)
+        self.assertEqual(self.material_db.get_waste_factor("Nonexistent"), 1.0)
+
     def test_labor_estimate(self):
         hours, cost = self.labor_calc.estimate_labor("Remove old tiles", "Marseille")
         if hours is not None and cost is not None:
@@ -40,6 +77,379 @@ class TestPricingLogic(unittest.TestCase):
         adj_conf = self.feedback.adjust_confidence(base_conf)
         self.assertLess(adj_conf, base_conf)
 
+    def test_match_template(self):
+        name, template = self.labor_calc.match_template("remove tiles")
+        self.assertEqual(name, "remove old tiles")
+        self.assertAlmostEqual(template["labor_hours"], 2.0)
+        self.assertEqual(self.labor_calc.match_template("frobnicate"), (None, None))
+
+    def test_price_ranges(self):
+        estimator = PriceRangeEstimator(n_samples=5000, seed=42)
+        task_inputs = [
+            {
+                "template": "remove old tiles",
+                "labor_cost": 80,
+                "materials": [
+                    {"name": "Ceramic tiles", "cost": 100, "area_based": True}
+                ],
+                "margin": 0.12,
+                "vat_rate": 0.10,
+            },
+            {
+                "template": None,
+                "labor_cost": 0,
+                "materials": [],
+                "margin": 0.12,
+                "vat_rate": 0.10,
+            },
+        ]
+        task_ranges, total_range = estimator.estimate(task_inputs)
+        p10, p50, p90 = task_ranges[0]
+        self.assertLess(p10, p50)
+        self.assertLess(p50, p90)
+        self.assertEqual(task_ranges[1], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(total_range[1], p50)
+
+    @unittest.skipUnless(importlib.util.find_spec("spacy"), "spaCy is not installed")
+    def test_quote_price_range_contains_total(self):
+        import pricing_engine
+
+        tasks = [
+            {"name": name, "materials": [{"name": mat}], "room_size_m2": 4}
+            for name, mat in [
+                ("remove tiles", "Ceramic tiles"),
+                ("replace toilet", "Toilet"),
+                ("install vanity", "Vanity"),
+                ("repaint walls", "Paint"),
+                ("redo plumbing", "Plumbing kit"),
+            ]
+        ]
+        quote = pricing_engine.generate_quote(tasks, "Paris", price_ranges=True)
+        # Quoted quantities include the catalog waste factor (tiles: 1.1)
+        self.assertAlmostEqual(quote["tasks"][0]["materials"][0]["quantity"], 4.4)
+        price_range = quote["price_range"]
+        self.assertLess(price_range["p10"], price_range["p50"])
+        self.assertLess(price_range["p50"], price_range["p90"])
+        # The quote is the most likely case; overrun risk puts the range above it
+        self.assertLessEqual(quote["total"], price_range["p90"])
+        for task in quote["tasks"]:
+            self.assertLessEqual(task["total_price"], task["price_range"]["p90"])
+
+    def test_invalid_sample_count(self):
+        for n_samples in (0, -5):
+            with self.assertRaises(ValueError):
+                PriceRangeEstimator(n_samples=n_samples)
+
+    def test_degenerate_distribution(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "uncertainty.json")
+            with open(path, "w") as f:
+                json.dump(
+                    {"defaults": {"unit_price": {"low": 1, "mode": 1, "high": 1}}}, f
+                )
+            estimator = PriceRangeEstimator(path, n_samples=1000, seed=0)
+        _, total_range = estimator.estimate(
+            [
+                {
+                    "template": None,
+                    "labor_cost": 0,
+                    "materials": [{"name": "Grout", "cost": 10, "area_based": False}],
+                    "margin": 0.0,
+                    "vat_rate": 0.0,
+                }
+            ]
+        )
+        self.assertEqual(total_range, [10.0, 10.0, 10.0])
+
+    def test_waste_factor_distributions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "uncertainty.json")
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        "materials": {
+                            "Paint": {
+                                "waste_factor": {"low": 0.9, "mode": 1.0, "high": 1.1}
+                            },
+                            "Ceramic tiles": {
+                                "waste_factor": {"low": 1.1, "mode": 1.1, "high": 1.1}
+                            },
+                        }
+                    },
+                    f,
+                )
+            estimator = PriceRangeEstimator(path, n_samples=1000, seed=0)
+        # Waste below 1.0 is rejected rather than rescaled
+        self.assertEqual(
+            estimator.get_distribution("waste_factor", material_name="Paint"),
+            (1.0, 1.0, 1.0),
+        )
+        # Sampled waste is relative to the waste already in the quoted cost
+        _, total_range = estimator.estimate(
+            [
+                {
+                    "template": None,
+                    "labor_cost": 0,
+                    "materials": [
+                        {
+                            "name": "Ceramic tiles",
+                            "cost": 110,
+                            "area_based": True,
+                            "waste_factor": 1.1,
+                        }
+                    ],
+                    "margin": 0.0,
+                    "vat_rate": 0.0,
+                }
+            ]
+        )
+        self.assertAlmostEqual(total_range[1], 110.0)
+
+    def test_centred_distributions(self):
+        estimator = PriceRangeEstimator(n_samples=20000, seed=1, centred=True)
+        low, mode, high = estimator.get_distribution(
+            "labor_hours", template_name="redo plumbing for shower"
+        )
+        self.assertAlmostEqual((low + mode + high) / 3, 1.0)
+        _, total_range = estimator.estimate(
+            [
+                {
+                    "template": "redo plumbing for shower",
+                    "labor_cost": 135,
+                    "materials": [
+                        {"name": "Plumbing kit", "cost": 80, "area_based": False}
+                    ],
+                    "margin": 0.0,
+                    "vat_rate": 0.0,
+                }
+            ]
+        )
+        self.assertLessEqual(total_range[0], 215)
+        self.assertLessEqual(215, total_range[2])
+
+    def test_analytics_export(self):
+        quote = {
+            "city": "Paris",
+            "tasks": [
+                {
+                    "name": "remove tiles",
+                    "materials": [
+                        {
+                            "name": "Ceramic tiles",
+                            "quantity": 4,
+                            "unit_price": 25,
+                            "unit": "m2",
+                            "total": 115,
+                        }
+                    ],
+                    "labor": {"hours": 2, "total": 96},
+                    "total_price": 300,
+                    "confidence": 1.0,
+                },
+                {"name": "do stuff", "materials": [], "total_price": 0, "confidence": 0.8},
+            ],
+            "total": 300,
+            "error_flag": True,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteAnalytics(tmp, fmt="npz")
+            self.assertEqual(store.append({"quote_2025-07-12T11-17-40": quote}), 1)
+            # Already exported quotes are skipped
+            self.assertEqual(store.append({"quote_2025-07-12T11-17-40": quote}), 0)
+            self.assertEqual(store.append({"quote_2025-07-13T09-00-00": quote}), 1)
+
+            reloaded = QuoteAnalytics(tmp)
+            tasks = reloaded.load_table("tasks", ["task", "error_flag"])
+            self.assertEqual(len(tasks["task"]), 4)
+            self.assertEqual(int(tasks["error_flag"].sum()), 2)
+            city_day = reloaded.rollup("city_day")
+            self.assertEqual(city_day["Paris|2025-07-12"]["count"], 1)
+            self.assertAlmostEqual(reloaded.rollup("city")["Paris"]["average"], 300)
+            self.assertEqual(reloaded.rollup("task")["do stuff"]["errors"], 2)
+            self.assertAlmostEqual(reloaded.rollup("material")["Ceramic tiles"]["total"], 230)
+            self.assertNotIn("errors", reloaded.rollup("material")["Ceramic tiles"])
+
+    def test_analytics_export_output_dir(self):
+        quote = {"city": "Marseille", "tasks": [], "total": 100}
+        with tempfile.TemporaryDirectory() as output_dir:
+            for name in ("quote_2025-07-12T11-17-40.json", "sample_quote.json"):
+                with open(os.path.join(output_dir, name), "w") as f:
+                    json.dump(quote, f)
+            with tempfile.TemporaryDirectory() as tmp:
+                store = QuoteAnalytics(tmp, fmt="npz")
+                self.assertEqual(store.export_output_dir(output_dir), 1)
+                self.assertEqual(store.rollup("city")["Marseille"]["count"], 1)
+                self.assertEqual(list(store.rollup("day")), ["2025-07-12"])
+
+    def test_analytics_manifest_parts(self):
+        quote = {"city": "Paris", "tasks": [], "total": 100}
+        with tempfile.TemporaryDirectory() as tmp:
+            first = QuoteAnalytics(tmp, fmt="npz")
+            second = QuoteAnalytics(tmp, fmt="npz")
+            first.append({"quote_2025-07-12T11-17-40": quote})
+            # A store opened before the first export must not drop its part
+            second.append({"quote_2025-07-13T09-00-00": quote})
+            # Leftover part from an interrupted export, never recorded in the manifest
+            np.savez(
+                os.path.join(tmp, "quotes", "part-orphan.npz"),
+                **analytics._to_columns("quotes", []),
+            )
+            reloaded = QuoteAnalytics(tmp)
+            self.assertEqual(len(reloaded.manifest["parts"]), 2)
+            self.assertEqual(len(reloaded.load_table("quotes")["quote_id"]), 2)
+            self.assertEqual(reloaded.rollup("city")["Paris"]["count"], 2)
+
+    @unittest.skipUnless(analytics.pq, "pyarrow is not installed")
+    def test_analytics_formats_share_dtypes(self):
+        quote = {"city": "Paris", "tasks": [{"name": "remove tiles"}], "total": 100}
+        tables = {}
+        for fmt in ("parquet", "npz"):
+            with tempfile.TemporaryDirectory() as tmp:
+                store = QuoteAnalytics(tmp, fmt=fmt)
+                store.append({"quote_2025-07-12T11-17-40": quote})
+                tables[fmt] = store.load_table("tasks")
+        for col, values in tables["npz"].items():
+            self.assertEqual(tables["parquet"][col].dtype, values.dtype, col)
+
+    @unittest.skipUnless(analytics.pq, "pyarrow is not installed")
+    def test_analytics_parquet_without_pyarrow(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteAnalytics(tmp, fmt="parquet")
+            store.append({"quote_2025-07-12T11-17-40": {"city": "Paris", "tasks": []}})
+            pq = analytics.pq
+            analytics.pq = None
+            try:
+                with self.assertRaises(ValueError):
+                    QuoteAnalytics(tmp).load_table("quotes")
+            finally:
+                analytics.pq = pq
+
+    def test_traffic_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = TrafficLog(os.path.join(tmp, "traffic.jsonl"))
+            stamp = datetime.datetime(2025, 7, 12, 11, 17, 40)
+            log.record("Remove old tiles. City: Paris.", timestamp=stamp)
+            log.record("Replace toilet.", city="Lyon")
+            records = log.load()
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["timestamp"], stamp)
+        self.assertIsNone(records[0]["city"])
+        self.assertEqual(records[1]["city"], "Lyon")
+
+    def test_shadow_report(self):
+        baseline = {
+            "tasks": [
+                {"name": "remove tiles", "total_price": 221.76},
+                {"name": "replace toilet", "total_price": 258.72},
+            ],
+            "total": 480.48,
+            "confidence": 1.0,
+            "error_flag": False,
+        }
+        candidate = {
+            "tasks": [
+                {"name": "remove tiles", "total_price": 231.76},
+                {"name": "do stuff", "total_price": 0},
+            ],
+            "total": 231.76,
+            "confidence": 0.8,
+            "error_flag": True,
+        }
+        diff = diff_quotes(baseline, candidate)
+        self.assertTrue(diff["changed"])
+        self.assertEqual(diff["tasks_added"], ["do stuff"])
+        self.assertEqual(diff["tasks_removed"], ["replace toilet"])
+        self.assertEqual(diff["tasks_changed"][0]["delta"], 10.0)
+        self.assertFalse(diff_quotes(baseline, baseline)["changed"])
+
+        # Quotes with missing or null prices still diff, without a delta
+        broken = {"tasks": [{"name": "remove tiles", "total_price": None}]}
+        diff = diff_quotes(baseline, dict(broken, total=None))
+        self.assertTrue(diff["changed"])
+        self.assertIsNone(diff["total"]["delta"])
+        self.assertIsNone(diff["tasks_changed"][0]["delta"])
+        self.assertIsNone(diff_quotes(broken, baseline)["total"]["delta"])
+
+        records = [
+            {"timestamp": datetime.datetime(2025, 7, 12), "transcript": "a"},
+            {"timestamp": datetime.datetime(2025, 7, 12), "transcript": "b"},
+        ]
+        timings = {"parse": 5.0, "quote": 2.0, "total": 7.0}
+        report = build_report(
+            records,
+            [{"quote": baseline, "timings": timings}] * 2,
+            [{"quote": candidate, "timings": timings}, {"error": "boom"}],
+        )
+        summary = report["summary"]
+        self.assertEqual(summary["changed"], 1)
+        self.assertEqual(summary["error_flag_changed"], 1)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(report["latency_ms"]["baseline"]["parse"]["count"], 2)
+        self.assertAlmostEqual(report["latency_ms"]["candidate"]["total"]["p50"], 7.0)
+
+    def test_replay_survives_worker_crash(self):
+        # Paced so the later requests are sent after the baseline worker died
+        start = datetime.datetime(2025, 7, 12)
+        records = [
+            {
+                "timestamp": start + datetime.timedelta(seconds=i * 0.2),
+                "transcript": text,
+            }
+            for i, text in enumerate(("ok", "crash", "ok", "ok"))
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "pricing_engine.py"), "w") as f:
+                f.write(textwrap.dedent(FAKE_ENGINE))
+            os.environ["CRASH_ON"] = "crash"
+            try:
+                baseline = replay.EngineWorker("baseline", tmp)
+            finally:
+                del os.environ["CRASH_ON"]
+            candidate = replay.EngineWorker("candidate", tmp)
+            baseline_results, candidate_results = replay.replay(
+                records, baseline, candidate, speed=1.0
+            )
+        self.assertIsNotNone(baseline.proc.poll())
+        self.assertIsNotNone(candidate.proc.poll())
+        self.assertIn("quote", baseline_results[0])
+        self.assertEqual(baseline_results[1:], [None, None, None])
+        self.assertTrue(all("quote" in r for r in candidate_results))
+        report = build_report(records, baseline_results, candidate_results)
+        self.assertEqual(report["summary"]["failed"], 3)
+
+    def test_replay_bad_candidate_engine(self):
+        started = []
+
+        class RecordingWorker(replay.EngineWorker):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                started.append(self)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "pricing_engine.py"), "w") as f:
+                f.write(textwrap.dedent(FAKE_ENGINE))
+            log_path = os.path.join(tmp, "traffic.jsonl")
+            TrafficLog(log_path).record("ok")
+            argv = [
+                "replay.py",
+                "--log",
+                log_path,
+                "--baseline-engine",
+                tmp,
+                "--candidate-engine",
+                os.path.join(tmp, "missing"),
+                "--report",
+                os.path.join(tmp, "report.json"),
+            ]
+            out = io.StringIO()
+            with mock.patch.object(sys, "argv", argv), mock.patch.object(
+                replay, "EngineWorker", RecordingWorker
+            ), contextlib.redirect_stdout(out):
+                replay.main()
+        self.assertIn("Error:", out.getvalue())
+        self.assertEqual(len(started), 1)
+        self.assertIsNotNone(started[0].proc.poll())
+
 
 if __name__ == "__main__":
     unittest.main()